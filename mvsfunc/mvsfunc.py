@@ -4,6 +4,7 @@
 ## Requirments:
 ##     fmtconv
 ##     BM3D
+##     BM3DCUDA (optional, for the GPU backends of BM3D)
 ################################################################################################################################
 ## Main functions:
 ##     Depth
@@ -68,6 +69,106 @@ else:
 
 VSMaxPlaneNum = 3
 
+# Preset values of "css" and their "HV" sub-sampling form
+_CSS_MAP = {
+    "444": "11", "4:4:4": "11",
+    "440": "12", "4:4:0": "12",
+    "422": "21", "4:2:2": "21",
+    "420": "22", "4:2:0": "22",
+    "411": "41", "4:1:1": "41",
+    "410": "42", "4:1:0": "42",
+}
+
+# Conversion of "dither" between fmtc.bitdepth (int, used as index) and zDepth (str)
+# "random" of zDepth and 1|2 of fmtc.bitdepth depend on "ampn", which is handled separately
+_DITHER_INT2STR = ("ordered", "none", "none") + ("error_diffusion",) * 7
+_DITHER_STR2INT = {"none": 1, "ordered": 0, "error_diffusion": 3}
+
+# Valid values of "dither" for fmtc.bitdepth (int) and zDepth (str)
+_DITHER_INTS = range(len(_DITHER_INT2STR))
+_DITHER_NAMES = frozenset(("none", "ordered", "random", "error_diffusion"))
+
+# Parameters only available in fmtc.bitdepth, zDepth is not preferred by default when any of them is set
+_FMTC_BITDEPTH_ARGS = ('ampo', 'ampn', 'dyn', 'staticnoise', 'cpuopt', 'patsize', 'tpdfo', 'tpdfn', 'corplane')
+
+# Matrices (in the str format of GetMatrix()) that core.resize can convert with the same coefficients as fmtc.matrix
+_ZIMG_MATRIX = {"709": "709", "FCC": "fcc", "601": "170m", "240": "240m", "YCgCo": "ycgco", "2020": "2020ncl"}
+
+# Kernels and chroma placements of fmtc.resample that have an equivalent in core.resize
+_ZIMG_KERNEL = {
+    "point": "point",
+    "linear": "bilinear", "bilinear": "bilinear",
+    "cubic": "bicubic", "bicubic": "bicubic",
+    "lanczos": "lanczos",
+    "spline16": "spline16", "spline36": "spline36", "spline64": "spline64",
+}
+_ZIMG_CHROMALOC = {"mpeg1": "center", "mpeg2": "left"}
+
+# Coefficients of fmtc.matrix for the opponent color space (OPP) used in BM3D
+_OPP_YUV2RGB = (1, 1, 2/3, 0, 1, 0, -4/3, 0, 1, -1, 2/3, 0)
+_OPP_RGB2YUV = (1/3, 1/3, 1/3, 0, 1/2, 0, -1/2, 0, 1/4, -1/2, 1/4, 0)
+
+# Processed integer bit depth for fmtc.matrix indexed by the required bit depth
+# Only 8-, 9-, 10-, 12-, 16-bit is supported by fmtc.matrix
+_FMTC_MATRIX_DEPTH = (8,) * 9 + (9, 10, 12, 12, 16, 16, 16, 16)
+
+# Input formats (sample type, bit depth) that fmtc.matrix can directly convert to another bit depth with "bits"
+_FMTC_MATRIX_INPUT = frozenset([(vs.INTEGER, bits) for bits in (8, 9, 10, 12, 16)] + [(vs.FLOAT, 32)])
+
+# Frame properties (without the leading "_") modified by SetColorSpace() and their valid ranges
+_COLORSPACE_PROPS = (
+    ("ChromaLocation", (0, 5)),
+    ("ColorRange", (0, 1)),
+    ("Primaries", None),
+    ("Matrix", None),
+    ("Transfer", None),
+)
+
+# Accepted values of "matrix" in GetMatrix() (int id or lower-case str) and their (id, str) formats
+_MATRIX_TABLE = {
+    0: (0, "RGB"), "rgb": (0, "RGB"), # GBR
+    1: (1, "709"), "709": (1, "709"), "bt709": (1, "709"), # bt709
+    2: (2, "Unspecified"), "unspecified": (2, "Unspecified"), "unspec": (2, "Unspecified"), # Unspecified
+    4: (4, "FCC"), "fcc": (4, "FCC"), # fcc
+    5: (5, "601"), "bt470bg": (5, "601"), "470bg": (5, "601"), # bt470bg
+    6: (6, "601"), "601": (6, "601"), "smpte170m": (6, "601"), "170m": (6, "601"), # smpte170m
+    7: (7, "240"), "240": (7, "240"), "smpte240m": (7, "240"), # smpte240m
+    8: (8, "YCgCo"), "ycgco": (8, "YCgCo"), "ycocg": (8, "YCgCo"), # YCgCo
+    9: (9, "2020"), "2020": (9, "2020"), "bt2020nc": (9, "2020"), "2020ncl": (9, "2020"), # bt2020nc
+    10: (10, "2020cl"), "2020cl": (10, "2020cl"), "bt2020c": (10, "2020cl"), # bt2020c
+    100: (100, "OPP"), "opp": (100, "OPP"), "opponent": (100, "OPP"), # opponent color space
+}
+
+# Default (id, str) matrix of GetMatrix() for YUV indexed by resolution level (SD, HD, UHD)
+_DEFAULT_MATRIX = ((6, "601"), (1, "709"), (9, "2020"))
+
+# Plugin namespaces of the BM3D implementations selectable by "backend" in BM3D()
+_BM3D_BACKENDS = {"cpu": "bm3d", "cuda": "bm3dcuda", "cuda_rtc": "bm3dcuda_rtc", "hip": "bm3dhip"}
+
+# "profile" presets of bm3d.Basic/bm3d.Final translated to (block_step, bm_range, ps_range) for BM3DCUDA
+# BM3DCUDA uses a fixed block size and group size of 8, so only these parameters are adjustable
+_BM3D_GPU_PROFILE = {
+    "fast": ((8, 9, 4), (7, 9, 5)),
+    "lc": ((6, 9, 4), (5, 9, 5)),
+    "np": ((4, 16, 5), (3, 16, 6)),
+    "high": ((3, 16, 7), (2, 16, 8)),
+    "vn": ((4, 16, 5), (6, 16, 6)),
+}
+
+# Expr templates of Min(), Max() and Avg() indexed by the clamped per-plane "mode" (0, 1, 2+)
+# "{offset}" is the subtraction of "neutral", which is empty for neutral=0
+_OPERATOR2_EXPR = {
+    'Min': ("", "x y min", "y{offset} abs x{offset} abs < y x ?"),
+    'Max': ("", "x y max", "y{offset} abs x{offset} abs > y x ?"),
+    'Avg': ("", "x y + 2 /", "x y + 2 /"),
+}
+
+# Expr of MinFilter() and MaxFilter(), taking the one of flt1 (y) and flt2 (z) closer to or farther from src (x)
+_MIN_MAX_FILTER_EXPR = {
+    'MinFilter': "x z - abs x y - abs < z y ?",
+    'MaxFilter': "x z - abs x y - abs > z y ?",
+}
+
 
 ################################################################################################################################
 
@@ -115,7 +216,8 @@ VSMaxPlaneNum = 3
 ##         When 11,13~15 bit integer or 16 bit float is involved, zDepth is always used.
 ##         - False: prefer fmtc.bitdepth
 ##         - True: prefer zDepth
-##         default: False
+##         default: True if core.resize is available, "dither" is not 2 or 4~9,
+##             and none of the fmtc.bitdepth specific parameters below is set, otherwise False
 ################################################################################################################################
 ## Parameters of fmtc.bitdepth
 ##     ampo, ampn, dyn, staticnoise, cpuopt, patsize, tpdfo, tpdfn, corplane:
@@ -206,71 +308,22 @@ def Depth(input, depth=None, sample=None, fulls=None, fulld=None,
             fulls = False
             fulld = False
 
-    # Whether to use zDepth or fmtc.bitdepth for conversion
-    # When 11,13~15 bit integer or 16 bit float is involved, force using zDepth
-    if useZ is None:
-        useZ = False
-    elif not isinstance(useZ, int):
+    # Whether to use zDepth or fmtc.bitdepth for conversion, and the dithering type
+    if useZ is not None and not isinstance(useZ, int):
         raise type_error('"useZ" must be a bool!')
-    if sSType == vs.INTEGER and (sbitPS == 13 or sbitPS == 15):
-        useZ = True
-    if dSType == vs.INTEGER and (dbitPS == 11 or 13 <= dbitPS <= 15):
-        useZ = True
-    if (sSType == vs.FLOAT and sbitPS < 32) or (dSType == vs.FLOAT and dbitPS < 32):
-        useZ = True
-
-    # Dithering type
+    if dither is not None and not isinstance(dither, (int, str)):
+        raise type_error('"dither" must be an int or a str!')
     if kwargs['ampn'] is not None and not isinstance(kwargs['ampn'], (int, float)):
         raise type_error('"ampn" must be an int or a float!')
+    if kwargs['ampo'] is not None and not isinstance(kwargs['ampo'], (int, float)):
+        raise type_error('"ampo" must be an int or a float!')
 
-    if dither is None:
-        if dbitPS == 32 or (dbitPS >= sbitPS and fulld == fulls and fulld == False):
-            dither = "none" if useZ else 1
-        else:
-            dither = "error_diffusion" if useZ else 3
-    elif not isinstance(dither, (int, str)):
-        raise type_error('"dither" must be an int or a str!')
-    else:
-        if isinstance(dither, str):
-            dither = dither.lower()
-            if dither != "none" and dither != "ordered" and dither != "random" and dither != "error_diffusion":
-                raise value_error('Unsupported "dither" specified!')
-        else:
-            if dither < 0 or dither > 9:
-                raise value_error('Unsupported "dither" specified!')
-        if useZ and isinstance(dither, int):
-            if dither == 0:
-                dither = "ordered"
-            elif dither == 1 or dither == 2:
-                if kwargs['ampn'] is not None and kwargs['ampn'] > 0:
-                    dither = "random"
-                else:
-                    dither = "none"
-            else:
-                dither = "error_diffusion"
-        elif not useZ and isinstance(dither, str):
-            if dither == "none":
-                dither = 1
-            elif dither == "ordered":
-                dither = 0
-            elif dither == "random":
-                if kwargs['ampn'] is None:
-                    dither = 1
-                    kwargs['ampn'] = 1
-                elif kwargs['ampn'] > 0:
-                    dither = 1
-                else:
-                    dither = 3
-            else:
-                dither = 3
-
-    if not useZ:
-        if kwargs['ampo'] is None:
-            kwargs['ampo'] = 1.5 if dither == 0 else 1
-        elif not isinstance(kwargs['ampo'], (int, float)):
-            raise type_error('"ampo" must be an int or a float!')
+    fmtcArgs = any(kwargs.get(arg) is not None for arg in _FMTC_BITDEPTH_ARGS)
+    useZ, dither, kwargs['ampn'], kwargs['ampo'] = _depth_dither_params(sSType, sbitPS, dSType, dbitPS, fulls, fulld,
+        dither, useZ, kwargs['ampn'], kwargs['ampo'], fmtcArgs)
 
     # Skip processing if not needed
+    # Only after the validation above, so that invalid arguments are still reported for no-op calls
     if dSType == sSType and dbitPS == sbitPS and (sSType == vs.FLOAT or fulld == fulls) and not lowDepth:
         return clip
 
@@ -279,7 +332,9 @@ def Depth(input, depth=None, sample=None, fulls=None, fulld=None,
         clip = zDepth(clip, sample=dSType, depth=dbitPS, range=fulld, range_in=fulls, dither_type=dither)
     else:
         clip = core.fmtc.bitdepth(clip, bits=dbitPS, flt=dSType, fulls=fulls, fulld=fulld, dmode=dither, **kwargs)
-        clip = SetColorSpace(clip, ColorRange=0 if fulld else 1)
+        # For low-depth output, the color range is tagged by the following quantization conversion
+        if not lowDepth:
+            clip = SetColorSpace(clip, ColorRange=0 if fulld else 1)
 
     # Low-depth support
     if lowDepth:
@@ -297,7 +352,7 @@ def Depth(input, depth=None, sample=None, fulls=None, fulld=None,
 ## Thus, if input is limited range RGB, it will be converted to full range.
 ## If matrix is 10, "2020cl" or "bt2020c", the output is linear RGB.
 ## Only constant format is supported, frame properties of the input clip is mostly ignored.
-## Note that you may get faster speed with core.resize, or not (for now, dither_type='error_diffusion' is slow).
+## When zimg is preferred (check "useZ" in Depth()), chroma re-sampling, matrix and depth conversion are done by a single core.resize call if possible.
 ## It's recommended to use Preview() for previewing now.
 ################################################################################################################################
 ## Basic parameters
@@ -333,6 +388,11 @@ def ToRGB(input, matrix=None, depth=None, sample=None, full=None,
     if not isinstance(input, vs.VideoNode):
         raise type_error('"input" must be a clip!')
 
+    # Nothing to convert for full range RGB input with the same output format
+    if input.format.color_family == vs.RGB and _is_same_depth(input.format, depth, sample) \
+        and (full is None or (isinstance(full, int) and full)):
+        return input
+
     # Get string format parameter "matrix"
     matrix = GetMatrix(input, matrix, True)
 
@@ -393,21 +453,7 @@ def ToRGB(input, matrix=None, depth=None, sample=None, full=None,
     fulld = True
 
     # Get properties of internal processed clip
-    pSType = max(sSType, dSType) # If float sample type is involved, then use float for conversion
-    if pSType == vs.FLOAT:
-        # For float sample type, only 32-bit is supported by fmtconv
-        pbitPS = 32
-    else:
-        # Apply conversion in the higher one of input and output bit depth
-        pbitPS = max(sbitPS, dbitPS)
-        # For integer sample type, only 8-, 9-, 10-, 12-, 16-bit is supported by fmtc.matrix
-        if sHSubS != 1 or sVSubS != 1:
-            # When chroma re-sampling is needed, always process in 16-bit for integer sample type
-            pbitPS = 16
-        elif pbitPS == 11:
-            pbitPS = 12
-        elif pbitPS > 12 and pbitPS < 16:
-            pbitPS = 16
+    pSType, pbitPS = _fmtc_processed_format(sSType, sbitPS, dSType, dbitPS, sHSubS != 1 or sVSubS != 1)
 
     # fmtc.resample parameters
     if kernel is None:
@@ -418,6 +464,13 @@ def ToRGB(input, matrix=None, depth=None, sample=None, full=None,
     elif not isinstance(kernel, str):
         raise type_error('"kernel" must be a str!')
 
+    # core.resize parameters, None if fmtconv should be used
+    zimgArgs = None
+    if sIsYUV and matrix in _ZIMG_MATRIX and dbitPS >= 8:
+        zimgArgs = _zimg_resample_args(kwargs, kernel, taps, a1, a2, cplace)
+    if zimgArgs is not None:
+        zimgArgs['dither_type'] = _zimg_dither(kwargs.get('dither'), kwargs.get('ampn'))
+
     # Conversion
     if sIsRGB:
         # Skip matrix conversion for RGB input
@@ -430,23 +483,29 @@ def ToRGB(input, matrix=None, depth=None, sample=None, full=None,
         clip = core.std.ShufflePlanes([clip,clip,clip], [0,0,0], vs.RGB)
         # Set output frame properties
         clip = SetColorSpace(clip, Matrix=0)
+    elif zimgArgs is not None:
+        # Apply chroma up-sampling, matrix conversion and depth conversion with core.resize
+        clip = core.resize.Bicubic(clip, format=RegisterFormat(vs.RGB, dSType, dbitPS, 0, 0).id,
+            matrix_in_s=_ZIMG_MATRIX[matrix], range_in=fulls, range=fulld, **zimgArgs)
     else:
         # Apply chroma up-sampling if needed
         if sHSubS != 1 or sVSubS != 1:
             clip = core.fmtc.resample(clip, kernel=kernel, taps=taps, a1=a1, a2=a2, css="444", planes=[2,3,3], fulls=fulls, fulld=fulls, cplace=cplace, flt=pSType==vs.FLOAT)
         # Apply depth conversion for processed clip
-        else:
+        # fmtc.matrix converts the bit depth by itself if the input format is supported
+        elif (pbitPS != sbitPS or pSType != sSType) and (matrix == "2020cl" or (sSType, sbitPS) not in _FMTC_MATRIX_INPUT):
             clip = Depth(clip, pbitPS, pSType, fulls, fulls, **kwargs)
         # Apply matrix conversion for YUV input
         if matrix == "OPP":
-            clip = core.fmtc.matrix(clip, fulls=fulls, fulld=fulld, coef=[1,1,2/3,0, 1,0,-4/3,0, 1,-1,2/3,0], col_fam=vs.RGB)
+            clip = core.fmtc.matrix(clip, fulls=fulls, fulld=fulld, coef=_OPP_YUV2RGB, col_fam=vs.RGB, bits=pbitPS)
             clip = SetColorSpace(clip, Matrix=0)
         elif matrix == "2020cl":
             clip = core.fmtc.matrix2020cl(clip, full=fulls)
         else:
-            clip = core.fmtc.matrix(clip, mat=matrix, fulls=fulls, fulld=fulld, col_fam=vs.RGB)
+            clip = core.fmtc.matrix(clip, mat=matrix, fulls=fulls, fulld=fulld, col_fam=vs.RGB, bits=pbitPS)
         # Apply depth conversion for output clip
-        clip = Depth(clip, dbitPS, dSType, fulld, fulld, **kwargs)
+        if clip.format.bits_per_sample != dbitPS or clip.format.sample_type != dSType:
+            clip = Depth(clip, dbitPS, dSType, fulld, fulld, **kwargs)
 
     # Output
     return clip
@@ -461,7 +520,8 @@ def ToRGB(input, matrix=None, depth=None, sample=None, full=None,
 ##     Thus, limited range RGB clip should first be manually converted to full range before calling this function.
 ## If matrix is 10, "2020cl" or "bt2020c", the input should be linear RGB.
 ## Only constant format is supported, frame properties of the input clip is mostly ignored.
-## Note that you may get faster speed with core.resize, or not (for now, dither_type='error_diffusion' is slow).
+## When zimg is preferred (check "useZ" in Depth()), matrix conversion, chroma re-sampling and depth conversion are done by a single core.resize call if possible,
+## which is also used for changing chroma sub-sampling of YUV input.
 ################################################################################################################################
 ## Basic parameters
 ##     input {clip}: clip to be converted
@@ -507,6 +567,14 @@ def ToYUV(input, matrix=None, css=None, depth=None, sample=None, full=None,
     if not isinstance(input, vs.VideoNode):
         raise type_error('"input" must be a clip!')
 
+    # Nothing to convert for YUV input with the same output format
+    # The output range is always the same as the input range for YUV input
+    if input.format.color_family == vs.YUV and _is_same_depth(input.format, depth, sample) \
+        and (css is None or (isinstance(css, str)
+            and _CSS_MAP.get(css, css) == f'{1 << input.format.subsampling_w}{1 << input.format.subsampling_h}')) \
+        and (full is None or isinstance(full, int)):
+        return input
+
     # Get string format parameter "matrix"
     matrix = GetMatrix(input, matrix, False)
 
@@ -587,37 +655,12 @@ def ToYUV(input, matrix=None, css=None, depth=None, sample=None, full=None,
     elif not isinstance(css, str):
         raise type_error('"css" must be a str!')
     else:
-        if css == "444" or css == "4:4:4":
-            css = "11"
-        elif css == "440" or css == "4:4:0":
-            css = "12"
-        elif css == "422" or css == "4:2:2":
-            css = "21"
-        elif css == "420" or css == "4:2:0":
-            css = "22"
-        elif css == "411" or css == "4:1:1":
-            css = "41"
-        elif css == "410" or css == "4:1:0":
-            css = "42"
+        css = _CSS_MAP.get(css, css)
         dHSubS = int(css[0])
         dVSubS = int(css[1])
 
     # Get properties of internal processed clip
-    pSType = max(sSType, dSType) # If float sample type is involved, then use float for conversion
-    if pSType == vs.FLOAT:
-        # For float sample type, only 32-bit is supported by fmtconv
-        pbitPS = 32
-    else:
-        # Apply conversion in the higher one of input and output bit depth
-        pbitPS = max(sbitPS, dbitPS)
-        # For integer sample type, only 8-, 9-, 10-, 12-, 16-bit is supported by fmtc.matrix
-        if pbitPS == 11:
-            pbitPS = 12
-        elif pbitPS > 12 and pbitPS < 16:
-            pbitPS = 16
-        if dHSubS != sHSubS or dVSubS != sVSubS:
-            # When chroma re-sampling is needed, always process in 16-bit for integer sample type
-            pbitPS = 16
+    pSType, pbitPS = _fmtc_processed_format(sSType, sbitPS, dSType, dbitPS, dHSubS != sHSubS or dVSubS != sVSubS)
 
     # fmtc.resample parameters
     if kernel is None:
@@ -628,13 +671,27 @@ def ToYUV(input, matrix=None, css=None, depth=None, sample=None, full=None,
     elif not isinstance(kernel, str):
         raise type_error('"kernel" must be a str!')
 
+    # core.resize parameters, None if fmtconv should be used
+    zimgArgs = None
+    if dbitPS >= 8 and dHSubS in (1, 2, 4) and dVSubS in (1, 2, 4):
+        if (sIsRGB and matrix in _ZIMG_MATRIX) or (sIsYUV and (dHSubS != sHSubS or dVSubS != sVSubS)):
+            zimgArgs = _zimg_resample_args(kwargs, kernel, taps, a1, a2, cplace)
+    if zimgArgs is not None:
+        dFormat = RegisterFormat(vs.YUV, dSType, dbitPS, dHSubS.bit_length() - 1, dVSubS.bit_length() - 1)
+        zimgArgs['dither_type'] = _zimg_dither(kwargs.get('dither'), kwargs.get('ampn'))
+
     # Conversion
-    if sIsYUV:
+    if sIsYUV and zimgArgs is not None:
+        # Skip matrix conversion for YUV input
+        # Change chroma sub-sampling and apply depth conversion with core.resize
+        clip = core.resize.Bicubic(clip, format=dFormat.id, range_in=fulls, range=fulld, **zimgArgs)
+    elif sIsYUV:
         # Skip matrix conversion for YUV input
         # Change chroma sub-sampling if needed
         if dHSubS != sHSubS or dVSubS != sVSubS:
             # Apply depth conversion for processed clip
-            clip = Depth(clip, pbitPS, pSType, fulls, fulls, **kwargs)
+            if pbitPS != sbitPS or pSType != sSType:
+                clip = Depth(clip, pbitPS, pSType, fulls, fulls, **kwargs)
             clip = core.fmtc.resample(clip, kernel=kernel, taps=taps, a1=a1, a2=a2, css=css, planes=[2,3,3], fulls=fulls, fulld=fulls, cplace=cplace)
         # Apply depth conversion for output clip
         clip = Depth(clip, dbitPS, dSType, fulls, fulld, **kwargs)
@@ -644,25 +701,33 @@ def ToYUV(input, matrix=None, css=None, depth=None, sample=None, full=None,
         # Shuffle planes for Gray input
         widthc = input.width // dHSubS
         heightc = input.height // dVSubS
+        # Neutral chroma is constant, so the same frame is kept for all the frames
         UV = core.std.BlankClip(clip, width=widthc, height=heightc,
-            color=1 << (dbitPS - 1) if dSType == vs.INTEGER else 0)
+            color=1 << (clip.format.bits_per_sample - 1) if dSType == vs.INTEGER else 0, keep=True)
         clip = core.std.ShufflePlanes([clip,UV,UV], [0,0,0], vs.YUV)
+    elif zimgArgs is not None:
+        # Apply matrix conversion, chroma down-sampling and depth conversion with core.resize
+        clip = core.resize.Bicubic(clip, format=dFormat.id,
+            matrix_s=_ZIMG_MATRIX[matrix], range_in=fulls, range=fulld, **zimgArgs)
     else:
         # Apply depth conversion for processed clip
-        clip = Depth(clip, pbitPS, pSType, fulls, fulls, **kwargs)
+        # fmtc.matrix converts the bit depth by itself if the input format is supported
+        if (pbitPS != sbitPS or pSType != sSType) and (matrix == "2020cl" or (sSType, sbitPS) not in _FMTC_MATRIX_INPUT):
+            clip = Depth(clip, pbitPS, pSType, fulls, fulls, **kwargs)
         # Apply matrix conversion for RGB input
         if matrix == "OPP":
-            clip = core.fmtc.matrix(clip, fulls=fulls, fulld=fulld, coef=[1/3,1/3,1/3,0, 1/2,0,-1/2,0, 1/4,-1/2,1/4,0], col_fam=vs.YUV)
+            clip = core.fmtc.matrix(clip, fulls=fulls, fulld=fulld, coef=_OPP_RGB2YUV, col_fam=vs.YUV, bits=pbitPS)
             clip = SetColorSpace(clip, Matrix=2)
         elif matrix == "2020cl":
             clip = core.fmtc.matrix2020cl(clip, full=fulld)
         else:
-            clip = core.fmtc.matrix(clip, mat=matrix, fulls=fulls, fulld=fulld, col_fam=vs.YUV)
+            clip = core.fmtc.matrix(clip, mat=matrix, fulls=fulls, fulld=fulld, col_fam=vs.YUV, bits=pbitPS)
         # Change chroma sub-sampling if needed
         if dHSubS != sHSubS or dVSubS != sVSubS:
             clip = core.fmtc.resample(clip, kernel=kernel, taps=taps, a1=a1, a2=a2, css=css, planes=[2,3,3], fulls=fulld, fulld=fulld, cplace=cplace)
         # Apply depth conversion for output clip
-        clip = Depth(clip, dbitPS, dSType, fulld, fulld, **kwargs)
+        if clip.format.bits_per_sample != dbitPS or clip.format.sample_type != dSType:
+            clip = Depth(clip, dbitPS, dSType, fulld, fulld, **kwargs)
 
     # Output
     return clip
@@ -693,6 +758,13 @@ def ToYUV(input, matrix=None, css=None, depth=None, sample=None, full=None,
 ##     radius2 {int}: temporal radius of final estimate
 ##         default is the same as "radius1"
 ##     profile1 {str}: same as "profile" in BM3D basic estimate
+##         - "auto": "fast" with "block_step" and "bm_range" chosen according to the size of input clip,
+##             block_step=8 (7 for final estimate) from 1080 on and 6 (5) below, bm_range=9 up to 720 and 16 above,
+##             only applied to "block_step1"/"bm_range1" that are not specified
+##             it's never faster than "fast" (block_step=8, bm_range=9) it replaces, and slower for any input size:
+##             below 1080, block_step=6 matches about 1.8x the reference blocks of "fast",
+##             above 720, bm_range=16 searches about 3x the area of "fast",
+##             in exchange for better matching of larger motion at higher resolutions
 ##         default: "fast"
 ##     profile2 {str}: same as "profile" in BM3D final estimate
 ##         default is the same as "profile1"
@@ -713,7 +785,12 @@ def ToYUV(input, matrix=None, css=None, depth=None, sample=None, full=None,
 ##     psample {int}: internal processed precision
 ##         - 0: 16-bit integer, less accuracy, less memory consumption
 ##         - 1: 32-bit float, more accuracy, more memory consumption
+##         - 2: 16-bit float, less memory consumption, only for the GPU backends with half precision support (check "backend")
 ##         default: 1
+##     opp {bool}: whether to filter RGB input in the opponent color space (OPP)
+##         set False to skip the RGB<->OPP conversions and filter RGB input directly, "sigma" then applies to R, G, B
+##         only makes sense for RGB input with output=0 or output=1
+##         default: True
 ################################################################################################################################
 ## Parameters of input properties
 ##     matrix {int|str}: color matrix of input clip, only makes sense for YUV input
@@ -753,6 +830,18 @@ def ToYUV(input, matrix=None, css=None, depth=None, sample=None, full=None,
 ##     block_size2, block_step2, group_size2, bm_range2, bm_step2, ps_num2, ps_range2, ps_step2, th_mse2:
 ##         same as those in bm3d.Final/bm3d.VFinal
 ################################################################################################################################
+## Parameters of BM3D backend
+##     backend {str}: implementation of BM3D used for filtering
+##         - "cpu": bm3d.Basic/bm3d.Final/bm3d.VBasic/bm3d.VFinal of VapourSynth-BM3D
+##         - "cuda": bm3dcuda.BM3D of VapourSynth-BM3DCUDA
+##         - "cuda_rtc": bm3dcuda_rtc.BM3D of VapourSynth-BM3DCUDA
+##         - "hip": bm3dhip.BM3D of VapourSynth-BM3DCUDA
+##         for the GPU backends, "profile1" and "profile2" are translated to "block_step", "bm_range" and "ps_range",
+##         "block_step1", "bm_range1", "ps_num1", "ps_range1" and "block_step2", "bm_range2", "ps_num2", "ps_range2" are
+##         passed through, other parameters of BM3D basic/final estimate are ignored,
+##         "psample" must be 1 (vs.FLOAT) or 2 (16-bit float) and "pre" is not supported
+##         default: "cpu"
+################################################################################################################################
 ## Parameters of depth conversion
 ##     dither, useZ, ampo, ampn, dyn, staticnoise, cpuopt, patsize, tpdfo, tpdfn, corplane:
 ##         same as those in Depth()
@@ -766,7 +855,7 @@ def BM3D(input, sigma=None, radius1=None, radius2=None, profile1=None, profile2=
     cd_kernel=None, cd_taps=None, cd_a1=None, cd_a2=None, cd_cplace=None,
     block_size1=None, block_step1=None, group_size1=None, bm_range1=None, bm_step1=None, ps_num1=None, ps_range1=None, ps_step1=None, th_mse1=None, hard_thr=None,
     block_size2=None, block_step2=None, group_size2=None, bm_range2=None, bm_step2=None, ps_num2=None, ps_range2=None, ps_step2=None, th_mse2=None,
-    **kwargs):
+    backend=None, opp=None, **kwargs):
     # input clip
     clip = input
 
@@ -808,10 +897,24 @@ def BM3D(input, sigma=None, radius1=None, radius2=None, profile1=None, profile2=
         psample = vs.FLOAT
     elif not isinstance(psample, int):
         raise type_error('"psample" must be an int!')
-    elif psample != vs.INTEGER and psample != vs.FLOAT:
-        raise value_error('"psample" must be either 0 (vs.INTEGER) or 1 (vs.FLOAT)!')
-    pbitPS = 16 if psample == vs.INTEGER else 32
-    pSType = psample
+    elif psample != vs.INTEGER and psample != vs.FLOAT and psample != 2:
+        raise value_error('"psample" must be 0 (vs.INTEGER), 1 (vs.FLOAT) or 2 (16-bit float)!')
+    pbitPS = 32 if psample == vs.FLOAT else 16
+    pSType = vs.INTEGER if psample == vs.INTEGER else vs.FLOAT
+
+    # BM3D implementation
+    if backend is None:
+        backend = "cpu"
+    elif not isinstance(backend, str):
+        raise type_error('"backend" must be a str!')
+    else:
+        backend = backend.lower()
+        if backend not in _BM3D_BACKENDS:
+            raise value_error('Unsupported "backend" specified!')
+    if backend != "cpu" and pSType != vs.FLOAT:
+        raise value_error(f'"psample" must be 1 (vs.FLOAT) or 2 (16-bit float) for backend="{backend}"!')
+    if backend == "cpu" and psample == 2:
+        raise value_error('"psample" of 2 (16-bit float) is not supported by backend="cpu"!')
 
     # Chroma sub-sampling parameters
     if css is None:
@@ -821,18 +924,7 @@ def BM3D(input, sigma=None, radius1=None, radius2=None, profile1=None, profile2=
     elif not isinstance(css, str):
         raise type_error('"css" must be a str!')
     else:
-        if css == "444" or css == "4:4:4":
-            css = "11"
-        elif css == "440" or css == "4:4:0":
-            css = "12"
-        elif css == "422" or css == "4:2:2":
-            css = "21"
-        elif css == "420" or css == "4:2:0":
-            css = "22"
-        elif css == "411" or css == "4:1:1":
-            css = "41"
-        elif css == "410" or css == "4:1:0":
-            css = "42"
+        css = _CSS_MAP.get(css, css)
         dHSubS = int(css[0])
         dVSubS = int(css[1])
 
@@ -840,23 +932,28 @@ def BM3D(input, sigma=None, radius1=None, radius2=None, profile1=None, profile2=
         cd_cplace = cu_cplace
 
     # Parameters processing
+    # A new list is always built, so the list passed by the caller is never modified
     if sigma is None:
         sigma = [5.0,5.0,5.0]
+    elif isinstance(sigma, (int, float)):
+        sigma = [float(sigma)] * 3
+    elif isinstance(sigma, Sequence) and not isinstance(sigma, str):
+        if len(sigma) < 1:
+            raise value_error('"sigma" must not be empty!')
+        sigma = [float(s) for s in sigma[:3]]
+        sigma += [sigma[-1]] * (3 - len(sigma))
     else:
-        if isinstance(sigma, int):
-            sigma = float(sigma)
-            sigma = [sigma,sigma,sigma]
-        elif isinstance(sigma, float):
-            sigma = [sigma,sigma,sigma]
-        elif isinstance(sigma, list):
-            while len(sigma) < 3:
-                sigma.append(sigma[len(sigma) - 1])
-        else:
-            raise type_error('sigma must be a float[] or an int[]!')
+        raise type_error('sigma must be a float[] or an int[]!')
     if sIsGRAY:
         sigma = [sigma[0],0,0]
     skip = sigma[0] <= 0 and sigma[1] <= 0 and sigma[2] <= 0
 
+    # Nothing to filter or convert, return the input before any node is created
+    # "css" is already resolved above, so compare the sub-sampling instead of testing the argument
+    if skip and ref is None and (output is None or output == 0) and dHSubS == sHSubS and dVSubS == sVSubS \
+        and depth is None and sample is None:
+        return input
+
     if radius1 is None:
         radius1 = 0
     elif not isinstance(radius1, int):
@@ -878,6 +975,10 @@ def BM3D(input, sigma=None, radius1=None, radius2=None, profile1=None, profile2=
         profile2 = profile1
     elif not isinstance(profile2, str):
         raise type_error('"profile2" must be a str!')
+    if profile1.lower() == "auto":
+        profile1, block_step1, bm_range1 = _bm3d_auto_profile(input.width, input.height, False, block_step1, bm_range1)
+    if profile2.lower() == "auto":
+        profile2, block_step2, bm_range2 = _bm3d_auto_profile(input.width, input.height, True, block_step2, bm_range2)
 
     if refine is None:
         refine = 1
@@ -893,6 +994,16 @@ def BM3D(input, sigma=None, radius1=None, radius2=None, profile1=None, profile2=
     elif output < 0 or output > 2:
         raise value_error('valid values of "output" are 0, 1 and 2!')
 
+    if opp is None:
+        opp = True
+    elif not isinstance(opp, int):
+        raise type_error('"opp" must be a bool!')
+    if not opp and output == 2:
+        raise value_error('"opp" must be True when output=2!')
+    # RGB input is filtered directly without OPP conversion
+    opp = opp or not sIsRGB
+    pColorFamily = vs.YUV if opp else vs.RGB
+
     if pre is not None:
         if not isinstance(pre, vs.VideoNode):
             raise type_error('"pre" must be a clip!')
@@ -900,6 +1011,8 @@ def BM3D(input, sigma=None, radius1=None, radius2=None, profile1=None, profile2=
             raise value_error('clip "pre" must be of the same format as the input clip!')
         if pre.width != input.width or pre.height != input.height:
             raise value_error('clip "pre" must be of the same size as the input clip!')
+        if backend != "cpu":
+            raise value_error(f'clip "pre" is not supported by backend="{backend}"!')
 
     if ref is not None:
         if not isinstance(ref, vs.VideoNode):
@@ -948,6 +1061,22 @@ def BM3D(input, sigma=None, radius1=None, radius2=None, profile1=None, profile2=
         # Always full range output when output=1|output=2 (full range RGB or full range OPP)
         fulld = True
 
+    # Nothing to filter, convert the input to the output format directly instead of a round trip through OPP
+    if skip and ref is None and output == 0:
+        if sIsYUV:
+            # Chroma up-sampling parameters apply when "css" up-samples, otherwise the down-sampling ones
+            if dHSubS < sHSubS or dVSubS < sVSubS:
+                return ToYUV(input, matrix, css, dbitPS, dSType, fulls,
+                    cu_kernel, cu_taps, cu_a1, cu_a2, cu_cplace, **kwargs)
+            return ToYUV(input, matrix, css, dbitPS, dSType, fulls,
+                cd_kernel, cd_taps, cd_a1, cd_a2, cd_cplace, **kwargs)
+        return Depth(input, dbitPS, dSType, fulls, fulld, **kwargs)
+
+    # "pre" is only used for the basic estimate, which is replaced by "ref" if specified
+    # Drop it so that it's not converted for nothing (e.g. when the same clip is passed as "pre" and "ref")
+    if ref is not None:
+        pre = None
+
     # Convert to processed format
     # YUV/RGB input is converted to opponent color space as full range YUV
     # Gray input is converted to full range Gray
@@ -971,14 +1100,15 @@ def BM3D(input, sigma=None, radius1=None, radius2=None, profile1=None, profile2=
             ref = ToRGB(ref, matrix, pbitPS, pSType, fulls,
                 cu_kernel, cu_taps, cu_a1, cu_a2, cu_cplace, **kwargs)
         # Convert full range RGB to full range OPP
-        clip = ToYUV(clip, "OPP", "444", pbitPS, pSType, True,
-            cu_kernel, cu_taps, cu_a1, cu_a2, cu_cplace, **kwargs)
-        if pre is not None:
-            pre = ToYUV(pre, "OPP", "444", pbitPS, pSType, True,
-                cu_kernel, cu_taps, cu_a1, cu_a2, cu_cplace, **kwargs)
-        if ref is not None:
-            ref = ToYUV(ref, "OPP", "444", pbitPS, pSType, True,
+        if opp:
+            clip = ToYUV(clip, "OPP", "444", pbitPS, pSType, True,
                 cu_kernel, cu_taps, cu_a1, cu_a2, cu_cplace, **kwargs)
+            if pre is not None:
+                pre = ToYUV(pre, "OPP", "444", pbitPS, pSType, True,
+                    cu_kernel, cu_taps, cu_a1, cu_a2, cu_cplace, **kwargs)
+            if ref is not None:
+                ref = ToYUV(ref, "OPP", "444", pbitPS, pSType, True,
+                    cu_kernel, cu_taps, cu_a1, cu_a2, cu_cplace, **kwargs)
         # Convert OPP to Gray if only Y is processed
         srcOPP = clip
         if sigma[1] <= 0 and sigma[2] <= 0:
@@ -995,6 +1125,13 @@ def BM3D(input, sigma=None, radius1=None, radius2=None, profile1=None, profile2=
         flt = ref
     elif skip:
         flt = clip
+    elif backend != "cpu":
+        # Apply BM3D/V-BM3D basic estimate with BM3DCUDA
+        flt = _bm3d_gpu(backend, clip, None, sigma, radius1, profile1, False,
+            block_step1, bm_range1, ps_num1, ps_range1, opp and not onlyY)
+        # Shuffle Y plane back if not processed
+        if not onlyY and sigma[0] <= 0:
+            flt = core.std.ShufflePlanes([clip,flt,flt], [0,1,2], pColorFamily)
     elif radius1 < 1:
         # Apply BM3D basic estimate
         # Optional pre-filtered clip for block-matching can be specified by "pre"
@@ -1010,41 +1147,54 @@ def BM3D(input, sigma=None, radius1=None, radius2=None, profile1=None, profile2=
             th_mse=th_mse1, hard_thr=hard_thr, matrix=100).bm3d.VAggregate(radius=radius1, sample=pSType)
         # Shuffle Y plane back if not processed
         if not onlyY and sigma[0] <= 0:
-            flt = core.std.ShufflePlanes([clip,flt,flt], [0,1,2], vs.YUV)
+            flt = core.std.ShufflePlanes([clip,flt,flt], [0,1,2], pColorFamily)
 
     # Final estimate
+    # The arguments are the same for each refinement, only the reference clip changes
+    if radius2 < 1:
+        finalArgs = dict(profile=profile2, sigma=sigma,
+            block_size=block_size2, block_step=block_step2, group_size=group_size2,
+            bm_range=bm_range2, bm_step=bm_step2, th_mse=th_mse2, matrix=100)
+    else:
+        finalArgs = dict(profile=profile2, sigma=sigma, radius=radius2,
+            block_size=block_size2, block_step=block_step2, group_size=group_size2,
+            bm_range=bm_range2, bm_step=bm_step2, ps_num=ps_num2, ps_range=ps_range2, ps_step=ps_step2,
+            th_mse=th_mse2, matrix=100)
+
     for _ in range(0, refine):
         if skip:
             flt = clip
+        elif backend != "cpu":
+            # Apply BM3D/V-BM3D final estimate with BM3DCUDA
+            flt = _bm3d_gpu(backend, clip, flt, sigma, radius2, profile2, True,
+                block_step2, bm_range2, ps_num2, ps_range2, opp and not onlyY)
+            # Shuffle Y plane back if not processed
+            if not onlyY and sigma[0] <= 0:
+                flt = core.std.ShufflePlanes([clip,flt,flt], [0,1,2], pColorFamily)
         elif radius2 < 1:
             # Apply BM3D final estimate
-            flt = core.bm3d.Final(clip, ref=flt, profile=profile2, sigma=sigma,
-                block_size=block_size2, block_step=block_step2, group_size=group_size2,
-                bm_range=bm_range2, bm_step=bm_step2, th_mse=th_mse2, matrix=100)
+            flt = core.bm3d.Final(clip, ref=flt, **finalArgs)
         else:
             # Apply V-BM3D final estimate
-            flt = core.bm3d.VFinal(clip, ref=flt, profile=profile2, sigma=sigma, radius=radius2,
-                block_size=block_size2, block_step=block_step2, group_size=group_size2,
-                bm_range=bm_range2, bm_step=bm_step2, ps_num=ps_num2, ps_range=ps_range2, ps_step=ps_step2,
-                th_mse=th_mse2, matrix=100).bm3d.VAggregate(radius=radius2, sample=pSType)
+            flt = core.bm3d.VFinal(clip, ref=flt, **finalArgs).bm3d.VAggregate(radius=radius2, sample=pSType)
             # Shuffle Y plane back if not processed
             if not onlyY and sigma[0] <= 0:
-                flt = core.std.ShufflePlanes([clip,flt,flt], [0,1,2], vs.YUV)
+                flt = core.std.ShufflePlanes([clip,flt,flt], [0,1,2], pColorFamily)
 
     # Convert to output format
     if sIsGRAY:
         clip = Depth(flt, dbitPS, dSType, True, fulld, **kwargs)
     else:
-        # Shuffle back to YUV if not all planes are processed
+        # Shuffle back to YUV (or RGB) if not all planes are processed
         if onlyY:
-            clip = core.std.ShufflePlanes([flt,srcOPP,srcOPP], [0,1,2], vs.YUV)
+            clip = core.std.ShufflePlanes([flt,srcOPP,srcOPP], [0,1,2], pColorFamily)
         elif sigma[1] <= 0 or sigma[2] <= 0:
             clip = core.std.ShufflePlanes([flt, clip if sigma[1] <= 0 else flt,
-                clip if sigma[2] <= 0 else flt], [0,1,2], vs.YUV)
+                clip if sigma[2] <= 0 else flt], [0,1,2], pColorFamily)
         else:
             clip = flt
         # Convert to final output format
-        if output <= 1:
+        if output <= 1 and opp:
             # Convert full range OPP to full range RGB
             clip = ToRGB(clip, "OPP", pbitPS, pSType, True,
                 cu_kernel, cu_taps, cu_a1, cu_a2, cu_cplace, **kwargs)
@@ -1465,20 +1615,24 @@ def ShowAverage(clip, alignment=None):
     offset = [0, -0.5, -0.5] if sSType == vs.FLOAT and sIsYUV else [0, 0, 0]
 
     # Process and output
+    # Only the averages change per frame, the text node itself can't be avoided as text.Text takes a constant string
+    text_fn = core.text.Text
+
+    # The averages of all the planes are stored as separate properties of one clip,
+    # so only one frame needs to be requested for "prop_src"
+    propNames = [f'PlaneAverage{p}' for p in range(sNumPlanes)]
+
     def _ShowAverageFrame(n, f):
-        text = ""
         if sNumPlanes == 1:
-            average = f.props.PlaneAverage * valueRange + offset[0]
-            text += f"PlaneAverage[{0}]={average}"
+            text = f"PlaneAverage[0]={f.props.PlaneAverage0 * valueRange + offset[0]}"
         else:
-            for p in range(sNumPlanes):
-                average = f[p].props.PlaneAverage * valueRange + offset[p]
-                text += f"PlaneAverage[{p}]={average}\n"
-        return core.text.Text(clip, text, alignment)
+            text = "".join([f"PlaneAverage[{p}]={getattr(f.props, propNames[p]) * valueRange + offset[p]}\n"
+                for p in range(sNumPlanes)])
+        return text_fn(clip, text, alignment)
 
-    avg = []
+    avg = clip
     for p in range(sNumPlanes):
-        avg.append(PlaneAverage(clip, p))
+        avg = PlaneAverage(avg, p, propNames[p])
 
     return core.std.FrameEval(clip, _ShowAverageFrame, prop_src=avg)
 ################################################################################################################################
@@ -1526,13 +1680,9 @@ def FilterIf(src, flt, prop_name, props=None):
         props = src
 
     # FrameEval function
+    # A missing property is treated as False
     def _FilterIfFrame(n, f):
-        try:
-            if f.props.__getattr__(prop_name):
-                return flt
-        except KeyError:
-            pass
-        return src
+        return flt if f.props.get(prop_name) else src
 
     # Process
     return core.std.FrameEval(src, _FilterIfFrame, props)
@@ -1786,7 +1936,7 @@ def LimitFilter(flt, src, ref=None, thr=None, elast=None, brighten_thr=None, thr
     # Parameters
     if thr is None:
         thr = 1.0
-    elif isinstance(thr, int) or isinstance(thr, float):
+    elif isinstance(thr, (int, float)):
         if thr < 0:
             raise value_error('valid range of "thr" is [0, +inf)')
     else:
@@ -1794,7 +1944,7 @@ def LimitFilter(flt, src, ref=None, thr=None, elast=None, brighten_thr=None, thr
 
     if elast is None:
         elast = 2.0
-    elif isinstance(elast, int) or isinstance(elast, float):
+    elif isinstance(elast, (int, float)):
         if elast < 1:
             raise value_error('valid range of "elast" is [1, +inf)')
     else:
@@ -1802,7 +1952,7 @@ def LimitFilter(flt, src, ref=None, thr=None, elast=None, brighten_thr=None, thr
 
     if brighten_thr is None:
         brighten_thr = thr
-    elif isinstance(brighten_thr, int) or isinstance(brighten_thr, float):
+    elif isinstance(brighten_thr, (int, float)):
         if brighten_thr < 0:
             raise value_error('valid range of "brighten_thr" is [0, +inf)')
     else:
@@ -1810,7 +1960,7 @@ def LimitFilter(flt, src, ref=None, thr=None, elast=None, brighten_thr=None, thr
 
     if thrc is None:
         thrc = thr
-    elif isinstance(thrc, int) or isinstance(thrc, float):
+    elif isinstance(thrc, (int, float)):
         if thrc < 0:
             raise value_error('valid range of "thrc" is [0, +inf)')
     else:
@@ -1824,10 +1974,10 @@ def LimitFilter(flt, src, ref=None, thr=None, elast=None, brighten_thr=None, thr
         force_expr = True
 
     # planes
-    process = [0 for i in range(VSMaxPlaneNum)]
+    process = [0] * VSMaxPlaneNum
 
     if planes is None:
-        process = [1 for i in range(VSMaxPlaneNum)]
+        process = [1] * VSMaxPlaneNum
     elif isinstance(planes, int):
         if planes < 0 or planes >= VSMaxPlaneNum:
             raise value_error(f'valid range of "planes" is [0, {VSMaxPlaneNum})!')
@@ -1842,6 +1992,10 @@ def LimitFilter(flt, src, ref=None, thr=None, elast=None, brighten_thr=None, thr
     else:
         raise type_error('"planes" must be a (sequence of) int!')
 
+    # Nothing to limit, the output would be a copy of "flt"
+    if not any(process[:sNumPlanes]) or (ref is None and flt is src):
+        return flt
+
     # Process
     if thr <= 0 and brighten_thr <= 0:
         if sIsYUV:
@@ -1862,17 +2016,19 @@ def LimitFilter(flt, src, ref=None, thr=None, elast=None, brighten_thr=None, thr
         valueRange = (1 << sbitPS) - 1 if sSType == vs.INTEGER else 1
         limitExprY = _limit_filter_expr(ref is not None, thr, elast, brighten_thr, valueRange)
         limitExprC = _limit_filter_expr(ref is not None, thrc, elast, thrc, valueRange)
-        expr = []
-        for i in range(sNumPlanes):
-            if process[i]:
-                if i > 0 and (sIsYUV):
-                    expr.append(limitExprC)
-                else:
-                    expr.append(limitExprY)
+        # Chroma planes of YUV input are limited with "thrc"
+        planeExpr = [limitExprY, limitExprC, limitExprC] if sIsYUV else [limitExprY] * VSMaxPlaneNum
+        expr = [planeExpr[i] if process[i] else "" for i in range(sNumPlanes)]
+
+        # Every plane is a copy of either flt or src, pick them without std.Expr
+        passClips = {"": flt, "x": flt, "y": src}
+        if all(e.strip() in passClips for e in expr):
+            planeClips = [passClips[e.strip()] for e in expr]
+            if all(c is planeClips[0] for c in planeClips):
+                clip = planeClips[0]
             else:
-                expr.append("")
-
-        if ref is None:
+                clip = core.std.ShufflePlanes(planeClips, [0,1,2], sColorFamily)
+        elif ref is None:
             clip = core.std.Expr([flt, src], expr)
         else:
             clip = core.std.Expr([flt, src, ref], expr)
@@ -1996,12 +2152,12 @@ def CheckMatrix(clip, matrices=None, full=None, lower=None, upper=None):
 
     if lower is None:
         lower = -0.02
-    elif not (isinstance(lower, float) or isinstance(lower, int)):
+    elif not isinstance(lower, (int, float)):
         raise type_error('\'lower\' must be an int or a float!')
 
     if upper is None:
         upper = 1.02
-    elif not (isinstance(upper, float) or isinstance(upper, int)):
+    elif not isinstance(upper, (int, float)):
         raise type_error('\'upper\' must be an int or a float!')
 
     # Process
@@ -2128,62 +2284,26 @@ def SetColorSpace(clip, ChromaLocation=None, ColorRange=None, Primaries=None, Ma
     if not isinstance(clip, vs.VideoNode):
         raise type_error('"clip" must be a clip!')
 
-    # Modify frame properties
-    if ChromaLocation is None:
-        pass
-    elif isinstance(ChromaLocation, bool):
-        if ChromaLocation is False:
-            clip = RemoveFrameProp(clip, '_ChromaLocation')
-    elif isinstance(ChromaLocation, int):
-        if ChromaLocation >= 0 and ChromaLocation <=5:
-            clip = core.std.SetFrameProp(clip, prop='_ChromaLocation', intval=ChromaLocation)
-        else:
-            raise value_error('valid range of "ChromaLocation" is [0, 5]!')
-    else:
-        raise type_error('"ChromaLocation" must be an int or a bool!')
+    # Collect frame properties to set and to delete
+    props = {}
+    deletes = []
 
-    if ColorRange is None:
-        pass
-    elif isinstance(ColorRange, bool):
-        if ColorRange is False:
-            clip = RemoveFrameProp(clip, '_ColorRange')
-    elif isinstance(ColorRange, int):
-        if ColorRange >= 0 and ColorRange <=1:
-            clip = core.std.SetFrameProp(clip, prop='_ColorRange', intval=ColorRange)
+    values = (ChromaLocation, ColorRange, Primaries, Matrix, Transfer)
+    for (name, valid_range), value in zip(_COLORSPACE_PROPS, values):
+        if value is None:
+            pass
+        elif isinstance(value, bool):
+            if value is False:
+                deletes.append(f'_{name}')
+        elif isinstance(value, int):
+            if valid_range is not None and (value < valid_range[0] or value > valid_range[1]):
+                raise value_error(f'valid range of "{name}" is [{valid_range[0]}, {valid_range[1]}]!')
+            props[f'_{name}'] = value
         else:
-            raise value_error('valid range of "ColorRange" is [0, 1]!')
-    else:
-        raise type_error('"ColorRange" must be an int or a bool!')
+            raise type_error(f'"{name}" must be an int or a bool!')
 
-    if Primaries is None:
-        pass
-    elif isinstance(Primaries, bool):
-        if Primaries is False:
-            clip = RemoveFrameProp(clip, '_Primaries')
-    elif isinstance(Primaries, int):
-        clip = core.std.SetFrameProp(clip, prop='_Primaries', intval=Primaries)
-    else:
-        raise type_error('"Primaries" must be an int or a bool!')
-
-    if Matrix is None:
-        pass
-    elif isinstance(Matrix, bool):
-        if Matrix is False:
-            clip = RemoveFrameProp(clip, '_Matrix')
-    elif isinstance(Matrix, int):
-        clip = core.std.SetFrameProp(clip, prop='_Matrix', intval=Matrix)
-    else:
-        raise type_error('"Matrix" must be an int or a bool!')
-
-    if Transfer is None:
-        pass
-    elif isinstance(Transfer, bool):
-        if Transfer is False:
-            clip = RemoveFrameProp(clip, '_Transfer')
-    elif isinstance(Transfer, int):
-        clip = core.std.SetFrameProp(clip, prop='_Transfer', intval=Transfer)
-    else:
-        raise type_error('"Transfer" must be an int or a bool!')
+    # Modify frame properties
+    clip = _set_frame_props(clip, props, deletes)
 
     # Output
     return clip
@@ -2203,8 +2323,7 @@ def AssumeFrame(clip):
         raise type_error('"clip" must be a clip!')
 
     # Modify frame properties
-    clip = core.std.SetFrameProp(clip, prop='_FieldBased', intval=0)
-    clip = RemoveFrameProp(clip, '_Field')
+    clip = _set_frame_props(clip, {'_FieldBased': 0}, ['_Field'])
 
     # Output
     return clip
@@ -2223,8 +2342,7 @@ def AssumeTFF(clip):
         raise type_error('"clip" must be a clip!')
 
     # Modify frame properties
-    clip = core.std.SetFrameProp(clip, prop='_FieldBased', intval=2)
-    clip = RemoveFrameProp(clip, '_Field')
+    clip = _set_frame_props(clip, {'_FieldBased': 2}, ['_Field'])
 
     # Output
     return clip
@@ -2243,8 +2361,7 @@ def AssumeBFF(clip):
         raise type_error('"clip" must be a clip!')
 
     # Modify frame properties
-    clip = core.std.SetFrameProp(clip, prop='_FieldBased', intval=1)
-    clip = RemoveFrameProp(clip, '_Field')
+    clip = _set_frame_props(clip, {'_FieldBased': 1}, ['_Field'])
 
     # Output
     return clip
@@ -2270,8 +2387,7 @@ def AssumeField(clip, top):
         raise type_error('"top" must be a bool!')
 
     # Modify frame properties
-    clip = RemoveFrameProp(clip, '_FieldBased')
-    clip = core.std.SetFrameProp(clip, prop='_Field', intval=1 if top else 0)
+    clip = _set_frame_props(clip, {'_Field': 1 if top else 0}, ['_FieldBased'])
 
     # Output
     return clip
@@ -2397,59 +2513,18 @@ def GetMatrix(clip, matrix=None, dIsRGB=None, id=False):
     if not isinstance(id, int):
         raise type_error('"id" must be a bool!')
 
-    # Resolution level
-    SD = False
-    UHD = False
-
-    if clip.width <= 1024 and clip.height <= 576:
-        SD = True
-    elif clip.width <= 2048 and clip.height <= 1536:
-        pass # HD
-    else:
-        UHD = True
-
-    # Convert to string format
+    # Normalize "matrix" to a key of the matrix table
     if matrix is None:
-        matrix = "Unspecified"
-    elif not isinstance(matrix, (int, str)):
-        raise type_error('"matrix" must be an int or a str!')
+        key = 2
+    elif isinstance(matrix, str):
+        key = matrix.lower()
+    elif isinstance(matrix, int):
+        key = matrix
     else:
-        if isinstance(matrix, str):
-            matrix = matrix.lower()
-        if matrix == 0 or matrix == "rgb": # GBR
-            matrix = 0 if id else "RGB"
-        elif matrix == 1 or matrix == "709" or matrix == "bt709": # bt709
-            matrix = 1 if id else "709"
-        elif matrix == 2 or matrix == "unspecified" or matrix == "unspec": # Unspecified
-            matrix = 2 if id else "Unspecified"
-        elif matrix == 4 or matrix == "fcc": # fcc
-            matrix = 4 if id else "FCC"
-        elif matrix == 5 or matrix == "bt470bg" or matrix == "470bg": # bt470bg
-            matrix = 5 if id else "601"
-        elif matrix == 6 or matrix == "601" or matrix == "smpte170m" or matrix == "170m": # smpte170m
-            matrix = 6 if id else "601"
-        elif matrix == 7 or matrix == "240" or matrix == "smpte240m": # smpte240m
-            matrix = 7 if id else "240"
-        elif matrix == 8 or matrix == "ycgco" or matrix == "ycocg": # YCgCo
-            matrix = 8 if id else "YCgCo"
-        elif matrix == 9 or matrix == "2020" or matrix == "bt2020nc" or matrix == "2020ncl": # bt2020nc
-            matrix = 9 if id else "2020"
-        elif matrix == 10 or matrix == "2020cl" or matrix == "bt2020c": # bt2020c
-            matrix = 10 if id else "2020cl"
-        elif matrix == 100 or matrix == "opp" or matrix == "opponent": # opponent color space
-            matrix = 100 if id else "OPP"
-        else:
-            raise value_error('Unsupported matrix specified!')
-
-    # If unspecified, automatically determine it based on color family and resolution level
-    if matrix == 2 or matrix == "Unspecified":
-        if dIsRGB and sIsRGB:
-            matrix = 0 if id else "RGB"
-        else:
-            matrix = (6 if id else "601") if SD else (9 if id else "2020") if UHD else (1 if id else "709")
+        raise type_error('"matrix" must be an int or a str!')
 
     # Output
-    return matrix
+    return _resolve_matrix(clip.width, clip.height, sIsRGB, bool(dIsRGB), key, bool(id))
 ################################################################################################################################
 
 
@@ -2721,7 +2796,11 @@ def RemoveFrameProp(clip, prop):
     if hasattr(core.std, 'RemoveFrameProps'):
         # API >= 4
         return core.std.RemoveFrameProps(clip, prop)
-    return core.std.SetFrameProp(clip, prop, delete=True)
+    if isinstance(prop, str):
+        return core.std.SetFrameProp(clip, prop, delete=True)
+    for p in prop:
+        clip = core.std.SetFrameProp(clip, p, delete=True)
+    return clip
 ################################################################################################################################
 
 
@@ -2963,6 +3042,254 @@ def _quantization_conversion(clip, depths=None, depthd=None, sample=None, fulls=
 ################################################################################################################################
 
 
+################################################################################################################################
+## Internal used function to get the (sample type, bit depth) of the clip processed by fmtconv in ToRGB()/ToYUV()
+################################################################################################################################
+def _fmtc_processed_format(sSType, sbitPS, dSType, dbitPS, resample):
+    # If float sample type is involved, then use float for conversion
+    if sSType == vs.FLOAT or dSType == vs.FLOAT:
+        # For float sample type, only 32-bit is supported by fmtconv
+        return vs.FLOAT, 32
+    if resample:
+        # When chroma re-sampling is needed, always process in 16-bit for integer sample type
+        return vs.INTEGER, 16
+    # Apply conversion in the higher one of input and output bit depth
+    return vs.INTEGER, _FMTC_MATRIX_DEPTH[max(sbitPS, dbitPS)]
+################################################################################################################################
+
+
+################################################################################################################################
+## Internal used function to check if "depth" and "sample" of ToRGB()/ToYUV() keep the bit depth and sample type of the input
+## Invalid values are never treated as the same, so that they are still reported by the full parameter checks.
+################################################################################################################################
+def _is_same_depth(format, depth, sample):
+    if depth is not None and depth != format.bits_per_sample:
+        return False
+    if sample is None:
+        return depth is None or (vs.FLOAT if depth >= 32 else vs.INTEGER) == format.sample_type
+    return sample == format.sample_type
+################################################################################################################################
+
+
+################################################################################################################################
+## Internal used functions to do matrix conversion and chroma re-sampling with core.resize instead of fmtconv
+################################################################################################################################
+def _prefer_zimg(dither, kwargs):
+    # Default of "useZ": prefer zimg if available, unless fmtc.bitdepth specific dithering is requested
+    return _prefer_zimg_args(dither, any(kwargs.get(arg) is not None for arg in _FMTC_BITDEPTH_ARGS))
+################################################################################################################################
+def _prefer_zimg_args(dither, fmtcArgs):
+    if fmtcArgs or not hasattr(core, 'resize'):
+        return False
+    return not isinstance(dither, int) or dither in (0, 1, 3)
+################################################################################################################################
+def _zimg_resample_args(kwargs, kernel, taps, a1, a2, cplace):
+    # Return the chroma re-sampling arguments of core.resize, or None if it's not preferred or not equivalent
+    useZ = kwargs.get('useZ')
+    if useZ is None:
+        useZ = _prefer_zimg(kwargs.get('dither'), kwargs)
+    if not useZ or not hasattr(core, 'resize'):
+        return None
+
+    kernel = _ZIMG_KERNEL.get(kernel.lower())
+    if kernel is None:
+        return None
+
+    if cplace is None:
+        chromaloc = "left"
+    elif isinstance(cplace, str):
+        chromaloc = _ZIMG_CHROMALOC.get(cplace.lower())
+        if chromaloc is None:
+            return None
+    else:
+        return None
+
+    args = {'chromaloc_in_s': chromaloc, 'chromaloc_s': chromaloc, 'resample_filter_uv': kernel}
+    if kernel == "bicubic":
+        # Unspecified b/c default to 1/3 in fmtc.resample, but to b=0, c=0.5 in core.resize
+        args['filter_param_a_uv'] = 1 / 3 if a1 is None else a1
+        args['filter_param_b_uv'] = 1 / 3 if a2 is None else a2
+    elif kernel == "lanczos":
+        args['filter_param_a_uv'] = 4 if taps is None else taps
+    return args
+################################################################################################################################
+def _zimg_dither(dither, ampn=None):
+    # Convert "dither" of Depth() to "dither_type" of core.resize
+    # Validated with the same rules as Depth(), which is skipped when core.resize does the whole conversion
+    if dither is None:
+        return "error_diffusion"
+    if not isinstance(dither, (int, str)):
+        raise type_error('"dither" must be an int or a str!', num_stacks=2)
+    if isinstance(dither, str):
+        dither = dither.lower()
+        if dither not in _DITHER_NAMES:
+            raise value_error('Unsupported "dither" specified!', num_stacks=2)
+        return dither
+    if dither not in _DITHER_INTS:
+        raise value_error('Unsupported "dither" specified!', num_stacks=2)
+    dither = _DITHER_INT2STR[dither]
+    if dither == "none" and ampn is not None and ampn > 0:
+        dither = "random"
+    return dither
+################################################################################################################################
+
+
+################################################################################################################################
+## Internal used function to resolve the depth conversion method and dithering parameters for Depth()
+## The result only depends on scalar arguments, so it's cached for repeated calls with the same signature (e.g. in BM3D()).
+################################################################################################################################
+@functools.lru_cache(maxsize=128)
+def _depth_dither_params(sSType, sbitPS, dSType, dbitPS, fulls, fulld, dither, useZ, ampn, ampo, fmtcArgs):
+    # Whether to use zDepth or fmtc.bitdepth for conversion
+    # When 11,13~15 bit integer or 16 bit float is involved, force using zDepth
+    if useZ is None:
+        useZ = _prefer_zimg_args(dither, fmtcArgs)
+    if sSType == vs.INTEGER and (sbitPS == 13 or sbitPS == 15):
+        useZ = True
+    if dSType == vs.INTEGER and (dbitPS == 11 or 13 <= dbitPS <= 15):
+        useZ = True
+    if (sSType == vs.FLOAT and sbitPS < 32) or (dSType == vs.FLOAT and dbitPS < 32):
+        useZ = True
+
+    # Dithering type
+    if dither is None:
+        if dbitPS == 32 or (dbitPS >= sbitPS and fulld == fulls and fulld == False):
+            dither = "none" if useZ else 1
+        else:
+            dither = "error_diffusion" if useZ else 3
+    else:
+        if isinstance(dither, str):
+            dither = dither.lower()
+            if dither not in _DITHER_NAMES:
+                raise value_error('Unsupported "dither" specified!', num_stacks=2)
+        elif dither not in _DITHER_INTS:
+            raise value_error('Unsupported "dither" specified!', num_stacks=2)
+        if useZ and isinstance(dither, int):
+            dither = _DITHER_INT2STR[dither]
+            if dither == "none" and ampn is not None and ampn > 0:
+                dither = "random"
+        elif not useZ and isinstance(dither, str):
+            if dither == "random":
+                if ampn is None:
+                    dither = 1
+                    ampn = 1
+                elif ampn > 0:
+                    dither = 1
+                else:
+                    dither = 3
+            else:
+                dither = _DITHER_STR2INT[dither]
+
+    if not useZ and ampo is None:
+        ampo = 1.5 if dither == 0 else 1
+
+    return bool(useZ), dither, ampn, ampo
+################################################################################################################################
+
+
+################################################################################################################################
+## Internal used function to resolve "matrix" for GetMatrix()
+## The result only depends on scalar arguments, so it's cached for repeated calls with the same signature.
+################################################################################################################################
+@functools.lru_cache(maxsize=256)
+def _resolve_matrix(width, height, sIsRGB, dIsRGB, key, id):
+    entry = _MATRIX_TABLE.get(key)
+    if entry is None:
+        raise value_error('Unsupported matrix specified!', num_stacks=2)
+
+    # If unspecified, automatically determine it based on color family and resolution level
+    if entry[0] == 2:
+        if dIsRGB and sIsRGB:
+            entry = _MATRIX_TABLE[0]
+        else:
+            # Resolution level: 0 for SD, 1 for HD, 2 for UHD
+            if width <= 1024 and height <= 576:
+                level = 0
+            elif width <= 2048 and height <= 1536:
+                level = 1
+            else:
+                level = 2
+            entry = _DEFAULT_MATRIX[level]
+
+    # Output in int or string format
+    return entry[0] if id else entry[1]
+################################################################################################################################
+
+
+################################################################################################################################
+## Internal used function to resolve profile "auto" of BM3D() to "fast" with size-dependent "block_step" and "bm_range"
+## Block-matching dominates the cost of BM3D and scales with the number of reference blocks and the search window.
+## Compared with "fast" (block_step=8, bm_range=9), it costs more below 1080 (about 1.8x the reference blocks)
+## and above 720 (about 3x the search area), trading speed for matching larger motion at higher resolutions.
+## The final estimate uses a step 1 smaller than the basic estimate, the same as the presets of bm3d.
+################################################################################################################################
+def _bm3d_auto_profile(width, height, final, block_step, bm_range):
+    size = min(width, height)
+    if block_step is None:
+        block_step = 8 if size >= 1080 else 6
+        if final:
+            block_step -= 1
+    if bm_range is None:
+        bm_range = 9 if size <= 720 else 16
+    return "fast", block_step, bm_range
+################################################################################################################################
+
+
+################################################################################################################################
+## Internal used function to apply BM3D basic/final estimate with the GPU backends of VapourSynth-BM3DCUDA
+## The basic estimate is applied when "ref" is None, otherwise the final estimate.
+## With "radius" > 0, BM3Dv2 is used if available, which aggregates the temporal estimates internally,
+## otherwise the output of BM3D is aggregated by bm3d.VAggregate.
+################################################################################################################################
+def _bm3d_gpu(backend, clip, ref, sigma, radius, profile, final, block_step, bm_range, ps_num, ps_range, chroma):
+    name = _BM3D_BACKENDS[backend]
+    if not hasattr(core, name):
+        raise attribute_error(f'plugin "{name}" is required for backend="{backend}"!', num_stacks=2)
+    plugin = getattr(core, name)
+
+    preset = _BM3D_GPU_PROFILE.get(profile.lower())
+    if preset is None:
+        raise value_error(f'Unsupported profile "{profile}" for backend="{backend}"!', num_stacks=2)
+    preset = preset[1 if final else 0]
+
+    args = dict(sigma=sigma, radius=radius, chroma=chroma,
+        block_step=preset[0] if block_step is None else block_step,
+        bm_range=preset[1] if bm_range is None else bm_range,
+        ps_num=ps_num, ps_range=preset[2] if ps_range is None else ps_range)
+
+    if radius > 0 and hasattr(plugin, 'BM3Dv2'):
+        return plugin.BM3Dv2(clip, ref, **args)
+    if radius > 0:
+        # bm3d.VAggregate only outputs 32-bit float
+        if clip.format.bits_per_sample != 32:
+            raise value_error(f'"psample" of 2 (16-bit float) with temporal radius requires BM3Dv2 of backend="{backend}"!', num_stacks=2)
+        if not hasattr(core, 'bm3d'):
+            raise attribute_error(f'plugin "bm3d" is required for temporal radius with backend="{backend}" without BM3Dv2!', num_stacks=2)
+    clip = plugin.BM3D(clip, ref, **args)
+    if radius > 0:
+        clip = core.bm3d.VAggregate(clip, radius=radius, sample=vs.FLOAT)
+    return clip
+################################################################################################################################
+
+
+################################################################################################################################
+## Internal used function to set and delete multiple frame properties
+## std.SetFrameProps (API >= 4) sets all of them in one node, the deletion is done by RemoveFrameProp().
+################################################################################################################################
+def _set_frame_props(clip, props, deletes):
+    if props:
+        if hasattr(core.std, 'SetFrameProps'):
+            # API >= 4
+            clip = core.std.SetFrameProps(clip, **props)
+        else:
+            for prop, value in props.items():
+                clip = core.std.SetFrameProp(clip, prop=prop, intval=value)
+    if deletes:
+        clip = RemoveFrameProp(clip, deletes)
+    return clip
+################################################################################################################################
+
+
 ################################################################################################################################
 ## Internal used function to check the argument for frame property
 ################################################################################################################################
@@ -3011,48 +3338,29 @@ def _operator2(clip1, clip2, mode, neutral, name):
 
     # mode
     if mode is None:
-        mode = [1 for i in range(VSMaxPlaneNum)]
+        mode = [1] * VSMaxPlaneNum
     elif isinstance(mode, int):
-        mode = [mode for i in range(VSMaxPlaneNum)]
+        mode = [mode] * VSMaxPlaneNum
     elif isinstance(mode, list):
         for m in mode:
             if not isinstance(m, int):
                 raise type_error('"mode" must be a (sequence of) int!', num_stacks=2)
-        while len(mode) < VSMaxPlaneNum:
-            mode.append(mode[len(mode) - 1])
+        mode = mode + [mode[-1]] * (VSMaxPlaneNum - len(mode))
     else:
         raise type_error('"mode" must be a (sequence of) int!', num_stacks=2)
 
     # neutral
     if neutral is None:
         neutral = 1 << (sbitPS - 1) if sSType == vs.INTEGER else 0
-    elif not (isinstance(neutral, int) or isinstance(neutral, float)):
+    elif not isinstance(neutral, (int, float)):
         raise type_error('"neutral" must be an int or a float!', num_stacks=2)
 
     # Process and output
-    expr = []
-    for i in range(sNumPlanes):
-        if name == 'Min':
-            if mode[i] >= 2:
-                expr.append(f"y {neutral} - abs x {neutral} - abs < y x ?")
-            elif mode[i] == 1:
-                expr.append("x y min")
-            else:
-                expr.append("")
-        elif name == 'Max':
-            if mode[i] >= 2:
-                expr.append(f"y {neutral} - abs x {neutral} - abs > y x ?")
-            elif mode[i] == 1:
-                expr.append("x y max")
-            else:
-                expr.append("")
-        elif name == 'Avg':
-            if mode[i] >= 1:
-                expr.append("x y + 2 /")
-            else:
-                expr.append("")
-        else:
-            raise value_error('Unknown "name" specified!', num_stacks=1)
+    templates = _OPERATOR2_EXPR.get(name)
+    if templates is None:
+        raise value_error('Unknown "name" specified!', num_stacks=1)
+    offset = f" {neutral} -" if neutral else ""
+    expr = [templates[max(0, min(mode[i], 2))].format(offset=offset) for i in range(sNumPlanes)]
 
     return core.std.Expr([clip1, clip2], expr)
 ################################################################################################################################
@@ -3080,10 +3388,10 @@ def _min_max_filter(src, flt1, flt2, planes, name, safe=True):
     sNumPlanes = sFormat.num_planes
 
     # planes
-    process = [0 for i in range(VSMaxPlaneNum)]
+    process = [0] * VSMaxPlaneNum
 
     if planes is None:
-        process = [1 for i in range(VSMaxPlaneNum)]
+        process = [1] * VSMaxPlaneNum
     elif isinstance(planes, int):
         if planes < 0 or planes >= VSMaxPlaneNum:
             raise value_error(f'valid range of "planes" is [0, {VSMaxPlaneNum})!', num_stacks=2)
@@ -3099,20 +3407,12 @@ def _min_max_filter(src, flt1, flt2, planes, name, safe=True):
         raise type_error('"planes" must be a (sequence of) int!', num_stacks=2)
 
     # Process and output
-    expr = []
-    for i in range(sNumPlanes):
-        if process[i]:
-            if name == 'MinFilter':
-                _expr = "x z - abs x y - abs < z y ?"
-            elif name == 'MaxFilter':
-                _expr = "x z - abs x y - abs > z y ?"
-            else:
-                raise value_error('Unknown "name" specified!', num_stacks=1)
-            if safe:
-                _expr = f"x y - x z - * 0 < x {_expr} ?"
-            expr.append(_expr)
-        else:
-            expr.append("")
+    _expr = _MIN_MAX_FILTER_EXPR.get(name)
+    if _expr is None:
+        raise value_error('Unknown "name" specified!', num_stacks=1)
+    if safe:
+        _expr = f"x y - x z - * 0 < x {_expr} ?"
+    expr = [_expr if process[i] else "" for i in range(sNumPlanes)]
 
     return core.std.Expr([src, flt1, flt2], expr)
 ################################################################################################################################
@@ -3120,7 +3420,9 @@ def _min_max_filter(src, flt1, flt2, planes, name, safe=True):
 
 ################################################################################################################################
 ## Internal used functions for LimitFilter()
+## The expression only depends on scalar arguments, so it's cached for repeated calls with the same signature.
 ################################################################################################################################
+@functools.lru_cache(maxsize=128)
 def _limit_filter_expr(defref, thr, elast, largen_thr, value_range):
     flt = " x "
     src = " y "
@@ -3137,7 +3439,25 @@ def _limit_filter_expr(defref, thr, elast, largen_thr, value_range):
         limitExpr = f" {src} "
     elif thr >= value_range and largen_thr >= value_range:
         limitExpr = ""
+    elif 0 < thr < value_range and 0 < largen_thr < value_range:
+        # "dif" and "dif_abs" are evaluated only once, std.Expr doesn't eliminate common sub-expressions
+        # The threshold related constant is selected by the sign of "dif_ref" when "largen_thr" differs from "thr"
+        def _select(largen_value, value):
+            if largen_thr != thr:
+                return f" dup abs swap 0 > {largen_value} {value} ? "
+            return f" abs {value} "
+
+        if elast <= 1:
+            # final = dif_abs <= thr_1 ? flt : src
+            limitExpr = f" {dif_ref} {_select(largen_thr, thr)} <= {flt} {src} ? "
+        else:
+            # final = src + dif * clamp((thr_2 - dif_abs) / (thr_2 - thr_1), 0, 1)
+            # with thr_2 = thr_1 * elast, the weight is elast / (elast - 1) - dif_abs / (thr_1 * (elast - 1))
+            dif_top = dif_ref if defref else " dup "
+            limitExpr = (f" {src} {dif} {dif_top} {_select(-1 / (largen_thr * (elast - 1)), -1 / (thr * (elast - 1)))} * "
+                f"{elast / (elast - 1)} + 0 max 1 min * + ")
     else:
+        # Either "thr" or "largen_thr" takes src or flt as is, the two sides are built separately
         if thr <= 0:
             limitExpr = f" {src} "
         elif thr >= value_range:
@@ -3148,9 +3468,9 @@ def _limit_filter_expr(defref, thr, elast, largen_thr, value_range):
             thr_1 = thr
             thr_2 = thr * elast
             thr_slope = 1 / (thr_2 - thr_1)
-            # final = src + dif * (thr_2 - dif_abs) / (thr_2 - thr_1)
-            limitExpr = f" {src} {dif} {thr_2} {dif_abs} - * {thr_slope} * + "
-            limitExpr = f" {dif_abs} {thr_1} <= {flt} {dif_abs} {thr_2} >= {src} " + limitExpr + " ? ? "
+            # final = src + dif * clamp((thr_2 - dif_abs) / (thr_2 - thr_1), 0, 1)
+            # which is flt for dif_abs <= thr_1 and src for dif_abs >= thr_2
+            limitExpr = f" {src} {dif} {thr_2} {dif_abs} - {thr_slope} * 0 max 1 min * + "
 
         if largen_thr != thr:
             if largen_thr <= 0:
@@ -3163,9 +3483,9 @@ def _limit_filter_expr(defref, thr, elast, largen_thr, value_range):
                 thr_1 = largen_thr
                 thr_2 = largen_thr * elast
                 thr_slope = 1 / (thr_2 - thr_1)
-                # final = src + dif * (thr_2 - dif_abs) / (thr_2 - thr_1)
-                limitExprLargen = f" {src} {dif} {thr_2} {dif_abs} - * {thr_slope} * + "
-                limitExprLargen = f" {dif_abs} {thr_1} <= {flt} {dif_abs} {thr_2} >= {src} " + limitExprLargen + " ? ? "
+                # final = src + dif * clamp((thr_2 - dif_abs) / (thr_2 - thr_1), 0, 1)
+                # which is flt for dif_abs <= thr_1 and src for dif_abs >= thr_2
+                limitExprLargen = f" {src} {dif} {thr_2} {dif_abs} - {thr_slope} * 0 max 1 min * + "
             limitExpr = f" {flt} {ref} > " + limitExprLargen + " " + limitExpr + " ? "
 
     return limitExpr
@@ -3182,17 +3502,13 @@ def _limit_diff_lut(diff, thr, elast, largen_thr, planes):
 
     # Get properties of input clip
     sFormat = diff.format
+    if sFormat.sample_type != vs.INTEGER:
+        raise value_error('"diff" must be an int!', num_stacks=2)
 
-    sSType = sFormat.sample_type
     sbitPS = sFormat.bits_per_sample
 
-    if sSType == vs.INTEGER:
-        neutral = 1 << (sbitPS - 1)
-        value_range = (1 << sbitPS) - 1
-    else:
-        neutral = 0
-        value_range = 1
-        raise value_error('"diff" must be an int!', num_stacks=2)
+    neutral = 1 << (sbitPS - 1)
+    value_range = (1 << sbitPS) - 1
 
     # Process
     thr = thr * value_range / 255
@@ -3232,30 +3548,37 @@ def _limit_diff_lut(diff, thr, elast, largen_thr, planes):
     if thr <= 0 and largen_thr <= 0:
         return diff
     elif thr >= value_range / 2 and largen_thr >= value_range / 2:
-        def limitLut(x):
-            return neutral
-        return core.std.Lut(diff, planes=planes, function=limitLut)
-    elif elast <= 1:
-        def limitLut(x):
-            dif = x - neutral
-            dif_abs = abs(dif)
-            thr_1 = largen_thr if dif > 0 else thr
-            return neutral if dif_abs <= thr_1 else x
-        return core.std.Lut(diff, planes=planes, function=limitLut)
+        return core.std.Lut(diff, planes=planes, lut=[neutral] * (value_range + 1))
     else:
-        def limitLut(x):
-            dif = x - neutral
-            dif_abs = abs(dif)
-            thr_1 = largen_thr if dif > 0 else thr
-            thr_2 = thr_1 * elast
+        # dif = x - neutral, thr_1 = largen_thr if dif > 0 else thr, thr_2 = thr_1 * elast
+        # elast <= 1: neutral if dif_abs <= thr_1 else x
+        # elast > 1: neutral if dif_abs <= thr_1, x if dif_abs >= thr_2,
+        #     otherwise flt - dif * (dif_abs - thr_1) / (thr_2 - thr_1)
+        # The table is assembled from the segments of each side of neutral (dif = 0 is always neutral),
+        # only the values between thr_1 and thr_2 are computed one by one
+        lower = _limit_lut_side(neutral, neutral, -1, thr, thr * elast if elast > 1 else None)
+        upper = _limit_lut_side(neutral, value_range - neutral, 1, largen_thr, largen_thr * elast if elast > 1 else None)
+        return core.std.Lut(diff, planes=planes, lut=lower[::-1] + [neutral] + upper)
+################################################################################################################################
 
-            if dif_abs <= thr_1:
-                return neutral
-            elif dif_abs >= thr_2:
-                return x
-            else:
-                # final = flt - dif * (dif_abs - thr_1) / (thr_2 - thr_1)
-                thr_slope = 1 / (thr_2 - thr_1)
-                return round(dif * (dif_abs - thr_1) * thr_slope + neutral)
-        return core.std.Lut(diff, planes=planes, function=limitLut)
+
+################################################################################################################################
+## Internal used function to build one side of the table of _limit_diff_lut()
+## Returns the outputs for dif_abs = 1, 2, ..., count on the side of "sign" (-1 or 1), "thr_2" is None for elast <= 1.
+################################################################################################################################
+def _limit_lut_side(neutral, count, sign, thr_1, thr_2):
+    # dif_abs <= thr_1: neutral
+    limited = min(math.floor(thr_1), count)
+    # thr_1 < dif_abs < thr_2: ramp from neutral to x
+    if thr_2 is None:
+        ramped = limited
+    else:
+        ramped = min(max(math.ceil(thr_2) - 1, limited), count)
+    table = [neutral] * limited
+    if ramped > limited:
+        thr_slope = 1 / (thr_2 - thr_1)
+        table += [round(sign * d * (d - thr_1) * thr_slope + neutral) for d in range(limited + 1, ramped + 1)]
+    # dif_abs >= thr_2: x
+    table += range(neutral + sign * (ramped + 1), neutral + sign * (count + 1), sign)
+    return table
 ################################################################################################################################
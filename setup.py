@@ -4,7 +4,8 @@ import setuptools
 from pathlib import Path
 
 long_description = Path("README.md").read_text()
-install_requires = Path("requirements.txt").read_text()
+install_requires = [line.strip() for line in Path("requirements.txt").read_text().splitlines()
+    if line.strip() and not line.lstrip().startswith("#")]
 
 package_name = "mvsfunc"
 
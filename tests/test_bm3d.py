@@ -0,0 +1,12 @@
+import pytest
+
+vs = pytest.importorskip("vapoursynth")
+
+import mvsfunc as mvf
+
+
+@pytest.mark.parametrize("format", [vs.YUV420P8, vs.RGB24, vs.GRAY16])
+def test_bm3d_zero_sigma_returns_input(format):
+    clip = vs.core.std.BlankClip(width=64, height=64, format=format, length=1)
+    assert mvf.BM3D(clip, sigma=[0,0,0]) is clip
+    assert mvf.BM3D(clip, sigma=0) is clip